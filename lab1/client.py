@@ -17,38 +17,40 @@ def http_get(host, port, resource):
 
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         s.connect((host, port))
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # Send the request right away, no Nagle delay
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
         s.sendall(request.encode("utf-8"))
 
-        response = b""
+        # Collect chunks and join once, "+=" on bytes copies the whole response every time
+        chunks = []
         while True:
-            data = s.recv(4096)
+            data = s.recv(65536)
             if not data:
                 break
-            response += data
+            chunks.append(data)
 
-    return response
+    return b"".join(chunks)
 
 
 def parse_response(response):
-    """Split HTTP response into headers and body."""
+    """Split HTTP response into the raw header block, a header map and body."""
     header_data, _, body = response.partition(b"\r\n\r\n")
-    headers = header_data.decode("utf-8", errors="ignore").split("\r\n")
-    return headers, body
+    headers = {}  # lowercased name -> value, both kept as bytes
+    for line in header_data.split(b"\r\n")[1:]:
+        name, sep, value = line.partition(b":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return header_data, headers, body
 
 
 def run_client(host, port, resource, save_dir="client_savings"):
     response = http_get(host, port, resource)
-    headers, body = parse_response(response)
+    header_data, headers, body = parse_response(response)
 
-    content_type = None
-    for h in headers:
-        if h.lower().startswith("content-type"):
-            content_type = h.split(":", 1)[1].strip().lower()
-            break
+    content_type = headers.get(b"content-type", b"").decode("ascii", "ignore").lower()
 
     print("=== Response Headers ===")
-    for h in headers:
-        print(h)
+    print(header_data.decode("utf-8", errors="ignore").replace("\r\n", "\n"))
     print("=========================\n")
 
     # HTML → print to console
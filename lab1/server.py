@@ -1,118 +1,300 @@
-import socket
+import asyncio
+import functools
 import os
+import signal
+import socket
+import stat
 import sys
+import time
+import traceback
 import mimetypes
 import urllib.parse
 
-def generate_directory_listing(path, url_path):
-    """
-    Generates an HTML directory listing for the given path.
-    """
-    items = os.listdir(path)
-    items.sort()
-    html_items = []
+MAX_HEADER_SIZE = 64 * 1024    # bytes, bigger request headers get 413
+KEEP_ALIVE_TIMEOUT = 5         # seconds an idle connection stays open for the next request
+WORKER_STARTUP_TIME = 5        # seconds, a worker dying sooner than this is not restarted
 
-    # Url for parent directory
-    if url_path != "/":
-        parent_href = urllib.parse.urljoin(url_path + "/", "..")
-        html_items.append(f'<li><a href="{parent_href}">.. (parent)</a></li>')
+# Responses are fixed-shape, so they are pre-encoded and only the variable parts get filled in
+HEADER_FMT = b"HTTP/1.1 200 OK\r\nContent-Type: %b\r\nContent-Length: %d\r\n%b\r\n"
+CONNECTION_CLOSE = b"Connection: close\r\n"
+CONNECTION_KEEP_ALIVE = b"Connection: keep-alive\r\nKeep-Alive: timeout=%d\r\n" % KEEP_ALIVE_TIMEOUT
+HTML_CONTENT_TYPE = b"text/html; charset=UTF-8"
+RESPONSE_403 = b"HTTP/1.1 403 Forbidden\r\n\r\nForbidden"
+RESPONSE_404 = b"HTTP/1.1 404 Not Found\r\n\r\nFile not found"
+RESPONSE_405 = b"HTTP/1.1 405 Method Not Allowed\r\n\r\nMethod Not Allowed"
+RESPONSE_413 = b"HTTP/1.1 413 Payload Too Large\r\n\r\nRequest headers too large"
 
-    for item in items:
-        item_path = os.path.join(path, item)
-        href = urllib.parse.urljoin(url_path + "/", item)
-        if os.path.isdir(item_path):
-            href += "/"
-            html_items.append(f'<li>[DIR] <a href="{href}">{item}/</a></li>')
+# Every two-character hex escape (any letter case) -> the byte it stands for
+HEX_BYTES = {f"{a}{b}".encode("ascii"): bytes([int(a + b, 16)])
+             for a in "0123456789abcdefABCDEF" for b in "0123456789abcdefABCDEF"}
+
+def unquote_path(raw):
+    """
+    Percent-decodes a raw request path, bytes in and bytes out. Invalid escapes are
+    kept as they are, like urllib.parse.unquote does, but without its str/unicode handling.
+    """
+    if b"%" not in raw:
+        return raw
+    parts = raw.split(b"%")
+    out = [parts[0]]
+    for part in parts[1:]:
+        byte = HEX_BYTES.get(part[:2])
+        if byte is None:
+            out.append(b"%")
+            out.append(part)
         else:
-            html_items.append(f'<li><a href="{href}">{item}</a></li>')
+            out.append(byte)
+            out.append(part[2:])
+    return b"".join(out)
 
-    html = f"""
+@functools.lru_cache(maxsize=256)
+def mime_for_ext(ext):
+    """
+    Encoded MIME type for a lowercased file extension like ".png", looked up once per extension.
+    """
+    return (mimetypes.guess_type("file" + ext)[0] or "application/octet-stream").encode("ascii")
+
+# Fixed parts of the listing page, encoded once at import
+HTML_HEAD = b"""
     <html>
     <head>
-        <title>Directory listing for {url_path}</title>
+        <title>Directory listing for """
+HTML_MID = b"""</title>
         <meta charset="UTF-8">
     </head>
     <body>
-        <h2>Index of {url_path}</h2>
+        <h2>Index of """
+HTML_LIST_OPEN = b"""</h2>
         <ul>
-            {''.join(html_items)}
+            """
+HTML_TAIL = b"""
         </ul>
     </body>
     </html>
     """
-    return html.encode("utf-8")  # Bites for socket
 
-def handle_request(conn, base_dir):
+def generate_directory_listing(path, url_path):
+    """
+    Generates an HTML directory listing for the given path.
+    """
+    # scandir gets the entry type from the directory read itself, no stat per entry
+    with os.scandir(path) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    html_items = []
+    # Links are plain concatenation, a full urljoin per entry is much more work than needed
+    base = url_path if url_path.endswith("/") else url_path + "/"
+
+    # Url for parent directory
+    if url_path != "/":
+        parent_href = base + ".."
+        html_items.append(f'<li><a href="{parent_href}">.. (parent)</a></li>'.encode("utf-8"))
+
+    for entry in entries:
+        item = entry.name
+        href = base + urllib.parse.quote(item, safe="")
+        if entry.is_dir():
+            href += "/"
+            html_items.append(f'<li>[DIR] <a href="{href}">{item}/</a></li>'.encode("utf-8"))
+        else:
+            html_items.append(f'<li><a href="{href}">{item}</a></li>'.encode("utf-8"))
+
+    url_bytes = url_path.encode("utf-8")
+    return b"".join([HTML_HEAD, url_bytes, HTML_MID, url_bytes, HTML_LIST_OPEN,
+                     *html_items, HTML_TAIL])  # Bites for socket
+
+@functools.lru_cache(maxsize=128)
+def cached_directory_listing(path, url_path, mtime_ns):
+    """
+    Same as generate_directory_listing, but reuses the page while the directory's
+    mtime is unchanged (adding, removing or renaming an entry changes it).
+    """
+    return generate_directory_listing(path, url_path)
+
+def wants_keep_alive(request, version):
+    """
+    HTTP/1.1 keeps the connection open unless the client sends "Connection: close",
+    HTTP/1.0 closes it unless the client sends "Connection: keep-alive".
+    """
+    for line in request.split(b"\r\n")[1:]:
+        name, sep, value = line.partition(b":")
+        if sep and name.strip().lower() == b"connection":
+            value = value.strip().lower()
+            if value == b"close":
+                return False
+            if value == b"keep-alive":
+                return True
+    return version == b"HTTP/1.1"
+
+async def handle_request(reader, writer, base_dir):
+    print(f"Connection from {writer.get_extra_info('peername')}")
+    try:
+        # Keep-alive: serve requests on this connection until the client closes it,
+        # asks to close, stays idle too long, or we answer with an error
+        while await serve_request(reader, writer, base_dir):
+            pass
+    finally:
+        writer.close()
+
+async def serve_request(reader, writer, base_dir):
+    """
+    Reads and answers one request. Returns True if the connection can be reused.
+    """
+    headers_sent = False
     try:
-        request = conn.recv(1024).decode("utf-8")    # Get 1024 bites and convert them in string
-        if not request:
-            return
+        # Headers can come in several TCP segments, so read up to the blank line
+        # that ends them (kept as bytes). The reader refuses more than MAX_HEADER_SIZE.
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+            return False    # Client closed (or went quiet) before sending a request
+        except asyncio.LimitOverrunError:
+            writer.write(RESPONSE_413)
+            await writer.drain()
+            return False
 
-        request_line = request.splitlines()[0]    # To split GET /index.html HTTP/1.1 \n Host: localhost:8080 \n User-Agent: Chrome
-        method, path, _ = request_line.split()
+        # Only the first line matters: GET /index.html HTTP/1.1 \r\n Host: localhost:8080 \r\n User-Agent: Chrome
+        # Find its end and split it, without decoding or splitting the whole request
+        eol = request.find(b"\r\n")
+        request_line = request[:eol] if eol != -1 else request
+        method, path, version = request_line.split(b" ", 2)
 
-        if method != "GET":
-            response = "HTTP/1.1 405 Method Not Allowed\r\n\r\nMethod Not Allowed"
-            conn.sendall(response.encode())
-            return
+        if method != b"GET":
+            writer.write(RESPONSE_405)
+            await writer.drain()
+            return False
 
-        # This part solves a trouble with %20 in URLs
-        filepath = urllib.parse.unquote(path.lstrip("/"))
+        keep_alive = wants_keep_alive(request, version)
+        connection = CONNECTION_KEEP_ALIVE if keep_alive else CONNECTION_CLOSE
+
+        # This part solves a trouble with %20 in URLs. surrogateescape keeps bytes
+        # that aren't valid UTF-8, so such file names still map back to the disk
+        filepath = unquote_path(path.lstrip(b"/")).decode("utf-8", "surrogateescape")
+        path = path.decode("utf-8")
         full_path = os.path.join(base_dir, filepath)
 
-        if not os.path.exists(full_path):
-            response = "HTTP/1.1 404 Not Found\r\n\r\nFile not found"
-            conn.sendall(response.encode())
-            return
-
-        if os.path.isdir(full_path):
-            body = generate_directory_listing(full_path, path)
-            headers = [
-                "HTTP/1.1 200 OK",
-                "Content-Type: text/html; charset=UTF-8",
-                f"Content-Length: {len(body)}",
-                "Connection: close"
-            ]
-            header_data = ("\r\n".join(headers) + "\r\n\r\n").encode("utf-8")
-            conn.sendall(header_data + body)
+        # base_dir is resolved once in run_server, anything that ends up outside it ("..", symlinks) is refused.
+        # One stat answers "exists?", "directory?" and "changed?".
+        # ValueError: a %00 in the URL puts a null byte in the path, no such file
+        try:
+            real_path = os.path.realpath(full_path)
+            if real_path != base_dir and not real_path.startswith(base_dir + os.sep):
+                writer.write(RESPONSE_403)
+                await writer.drain()
+                return False
+            st = os.stat(full_path)
+        except (FileNotFoundError, NotADirectoryError, ValueError):
+            writer.write(RESPONSE_404)
+            await writer.drain()
+            return False
+
+        if stat.S_ISDIR(st.st_mode):
+            body = cached_directory_listing(full_path, path, st.st_mtime_ns)
+            header_data = HEADER_FMT % (HTML_CONTENT_TYPE, len(body), connection)
+            # No header_data + body copy: since Python 3.12 the transport
+            # hands both buffers to a single sendmsg(2)
+            writer.writelines([header_data, body])
+            await writer.drain()
 
         else:
-            mime_type, _ = mimetypes.guess_type(full_path)
-            if mime_type is None:
-                mime_type = "application/octet-stream"
+            mime_type = mime_for_ext(os.path.splitext(full_path)[1].lower())
 
             with open(full_path, "rb") as f:
-                body = f.read()
+                size = os.fstat(f.fileno()).st_size    # The file as opened, it may have changed since the stat
+                header_data = HEADER_FMT % (mime_type, size, connection)
 
-            headers = [
-                "HTTP/1.1 200 OK",
-                f"Content-Type: {mime_type}",
-                f"Content-Length: {len(body)}",
-                "Connection: close"
-            ]
-            header_data = ("\r\n".join(headers) + "\r\n\r\n").encode("utf-8")
-            conn.sendall(header_data + body)
+                # asyncio already turns Nagle off (TCP_NODELAY), so without a cork the
+                # headers would leave as their own small packet. Corked, the kernel
+                # holds them and sends them together with the first file data.
+                sock = writer.get_extra_info("socket")
+                cork = hasattr(socket, "TCP_CORK")    # Linux only
+                if cork:
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 1)
+
+                writer.write(header_data)
+                headers_sent = True
+                await writer.drain()
+
+                # Zero-copy: the kernel sends file pages straight to the socket (sendfile(2)),
+                # the file is never loaded into Python memory. Where sendfile isn't
+                # available asyncio streams it in fixed-size chunks instead.
+                # sendfile refuses count=0, an empty file is just the header
+                if size:
+                    await asyncio.get_running_loop().sendfile(writer.transport, f, 0, size)
+
+                if cork:
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 0)    # Flush the last partial packet
+
+        return keep_alive
 
     except Exception as e:
+        if headers_sent:
+            return False    # A 200 is already on the wire, a 500 after it would corrupt the stream
         error_msg = f"HTTP/1.1 500 Internal Server Error\r\n\r\nError: {str(e)}"
-        conn.sendall(error_msg.encode())
+        writer.write(error_msg.encode())
+        await writer.drain()
+        return False
 
-def run_server(port, base_dir):
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:   #Note for me: IPv4, TCP (for UDP SOCK_DGRAM)
-        s.bind(("0.0.0.0", port))
-        s.listen(1)
-        print(f"Serving {base_dir} on port {port}...")
-        print(f"Open in browser: http://127.0.0.1:{port}/")
+async def run_server(port, base_dir):
+    base_dir = os.path.realpath(base_dir)    # Resolved once, serve_request compares against it
+    # One event loop serves all clients: while one waits on the network, others get handled.
+    # With reuse_port several worker processes can listen on the same port,
+    # the kernel spreads new connections between them.
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_request(reader, writer, base_dir),
+        "0.0.0.0", port, backlog=512, limit=MAX_HEADER_SIZE,
+        reuse_port=hasattr(socket, "SO_REUSEPORT"))
 
+    async with server:
+        await server.serve_forever()
+
+def start_worker(port, base_dir):
+    """
+    Forks a process running its own event loop, returns its pid.
+    """
+    sys.stdout.flush()    # Otherwise every child would print the parent's buffered output again
+    pid = os.fork()
+    if pid == 0:
+        # The parent's SIGTERM handler is not for workers. Stop like on Ctrl+C,
+        # so the buffered output below still gets flushed
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        code = 0
         try:
-            while True:
-                conn, addr = s.accept()
-                with conn:
-                    print(f"Connection from {addr}")
-                    handle_request(conn, base_dir)
+            asyncio.run(run_server(port, base_dir))
         except KeyboardInterrupt:
-            #This shit doesn't work :(
-            print("\nServer stopped by user")
+            pass
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        sys.stdout.flush()    # os._exit skips the usual flush at exit
+        sys.stderr.flush()
+        os._exit(code)    # Never fall back into the parent's loop
+    return pid
+
+def run_workers(port, base_dir, workers):
+    """
+    Runs one worker per core and starts a new one whenever a worker dies.
+    A worker failing right after its start (e.g. port already taken) stops the server.
+    """
+    children = {start_worker(port, base_dir): time.monotonic() for _ in range(workers)}
+    try:
+        while True:
+            pid, status = os.wait()
+            started = children.pop(pid, None)
+            # A worker that raised soon after its start would only fail the same way again
+            # (a killed one, e.g. by the OOM killer, is restarted)
+            if (started is not None and os.WIFEXITED(status) and os.WEXITSTATUS(status) != 0
+                    and time.monotonic() - started < WORKER_STARTUP_TIME):
+                print(f"Worker {pid} failed to start, stopping")
+                sys.exit(1)
+            print(f"Worker {pid} exited, starting a new one")
+            time.sleep(1)    # Don't spin if workers keep crashing
+            children[start_worker(port, base_dir)] = time.monotonic()
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -121,4 +303,17 @@ if __name__ == "__main__":
 
     port = 8080
     base_dir = sys.argv[1]
-    run_server(port, base_dir)
+    # Inside a container cpu_count() reports the host's cores, the affinity mask the usable ones
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    workers = int(os.environ.get("WORKERS", cores))
+    print(f"Serving {base_dir} on port {port}...")
+    print(f"Open in browser: http://127.0.0.1:{port}/")
+
+    try:
+        if workers > 1 and hasattr(os, "fork") and hasattr(socket, "SO_REUSEPORT"):
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))    # docker stop
+            run_workers(port, base_dir, workers)
+        else:
+            asyncio.run(run_server(port, base_dir))    # Windows: a single process
+    except KeyboardInterrupt:
+        print("\nServer stopped by user")
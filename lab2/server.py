@@ -1,73 +1,195 @@
 import socket
 import os
+import stat
 import sys
 import mimetypes
 import urllib.parse
 import threading
 import time
-from collections import defaultdict, deque
+import concurrent.futures
+import functools
+import logging
+from collections import defaultdict, OrderedDict
 
-request_counts = defaultdict(int)  # path -> number of requests
-counts_lock = threading.Lock()     # used to fix race condition
-rate_limits = defaultdict(deque)   # ip -> timestamps of recent requests
-rate_lock = threading.Lock()
+logger = logging.getLogger(__name__)
+
+COUNT_SHARDS = 16
+# path -> number of requests, split over shards so workers counting different
+# files don't wait on the same lock (used to fix race condition)
+count_shards = [(threading.Lock(), defaultdict(int)) for _ in range(COUNT_SHARDS)]
+buckets = {}                       # ip -> (tokens, last_refill) for the token bucket
+RATE_SHARDS = 16
+rate_locks = [threading.Lock() for _ in range(RATE_SHARDS)]  # one lock per group of IPs, not one for all
 
 RATE_LIMIT = 5     # requests per second per IP
-WORK_DELAY = 1.0   # artificial delay (seconds) for concurrency test
+RATE_SWEEP_INTERVAL = 60   # seconds between removals of idle rate-limit buckets
+WORK_DELAY = float(os.environ.get("WORK_DELAY", "1.0"))   # artificial delay (seconds) for concurrency test, 0 disables it
+MAX_WORKERS = 64   # upper bound on threads handling requests at once
+MAX_HEADER_SIZE = 64 * 1024   # bytes, bigger request headers get 413
+SMALL_FILE_LIMIT = 256 * 1024  # bytes, files up to this size are served from memory
+LISTING_CACHE_SIZE = 128   # directory pages kept, least recently used ones are dropped
+# Send buffer for accepted sockets. Setting SO_SNDBUF turns off the kernel's
+# autotuning for that socket, so keep it moderate: 1 MiB is enough for the
+# 64 KiB+ sendfile chunks without pinning lots of memory per connection.
+SEND_BUFFER_SIZE = 1 << 20
+
+def increment_count(path):
+    lock, counts = count_shards[hash(path) & (COUNT_SHARDS - 1)]
+    with lock:
+        counts[path] += 1
+
+def get_count(path):
+    _, counts = count_shards[hash(path) & (COUNT_SHARDS - 1)]
+    return counts.get(path, 0)
+
+LISTING_HEADER = b"""
+    <html>
+    <head>
+        <title>Directory listing for %b</title>
+        <meta charset="UTF-8">
+    </head>
+    <body>
+        <h2>Index of %b</h2>
+        <ul>
+            """
+LISTING_FOOTER = b"""
+        </ul>
+    </body>
+    </html>
+    """
+
+# (dir path, url path) -> (dir mtime_ns, file paths, their counts, html), in LRU order.
+# Bounded, since every spelling of a URL ("/", "//", "/./") gets its own entry
+listing_cache = OrderedDict()
+listing_cache_lock = threading.Lock()
+
+def generate_directory_listing(path, url_path, mtime):
+    # Reuse the last page while the directory is unchanged and
+    # none of its files were requested since. mtime (ns) comes from the caller's stat
+    key = (path, url_path)
+    with listing_cache_lock:
+        cached = listing_cache.get(key)
+        if cached:
+            listing_cache.move_to_end(key)
+    if cached and cached[0] == mtime:
+        _, files, counts, body = cached
+        if tuple(get_count(f) for f in files) == counts:
+            return body
 
-def generate_directory_listing(path, url_path):
     items = os.listdir(path)
     items.sort()
-    html_items = []
+    url_bytes = url_path.encode("utf-8")
+    html_items = [LISTING_HEADER % (url_bytes, url_bytes)]
+    files = []
+    counts = []
 
     if url_path != "/":
         parent_href = urllib.parse.urljoin(url_path + "/", "..")
-        html_items.append(f'<li><a href="{parent_href}">.. (parent)</a></li>')
+        html_items.append(f'<li><a href="{parent_href}">.. (parent)</a></li>'.encode("utf-8"))
 
     for item in items:
         item_path = os.path.join(path, item)
         href = urllib.parse.urljoin(url_path + "/", item)
         if os.path.isdir(item_path):
             href += "/"
-            html_items.append(f'<li>[DIR] <a href="{href}">{item}/</a></li>')
+            html_items.append(f'<li>[DIR] <a href="{href}">{item}/</a></li>'.encode("utf-8"))
         else:
-            count = request_counts[item_path]
+            count = get_count(item_path)
+            files.append(item_path)
+            counts.append(count)
             html_items.append(f'<li><a href="{href}">{item}</a> '
-                              f'(requests: {count})</li>')
+                              f'(requests: {count})</li>'.encode("utf-8"))
 
-    html = f"""
-    <html>
-    <head>
-        <title>Directory listing for {url_path}</title>
-        <meta charset="UTF-8">
-    </head>
-    <body>
-        <h2>Index of {url_path}</h2>
-        <ul>
-            {''.join(html_items)}
-        </ul>
-    </body>
-    </html>
-    """
-    return html.encode("utf-8")
+    html_items.append(LISTING_FOOTER)
+    body = b"".join(html_items)
+    with listing_cache_lock:
+        listing_cache[key] = (mtime, files, tuple(counts), body)
+        listing_cache.move_to_end(key)
+        if len(listing_cache) > LISTING_CACHE_SIZE:
+            listing_cache.popitem(last=False)
+    return body
+
+def guess_mime_type(path):
+    mime_type, _ = mimetypes.guess_type(path)
+    return mime_type or "application/octet-stream"
+
+@functools.lru_cache(maxsize=256)
+def load_small_file(path, mtime_ns):
+    # mtime_ns is only part of the cache key, so an edited file gets loaded again.
+    # Returns the whole response (headers + body) ready for a single sendall.
+    with open(path, "rb") as f:
+        body = f.read()
+    headers = [
+        "HTTP/1.1 200 OK",
+        f"Content-Type: {guess_mime_type(path)}",
+        f"Content-Length: {len(body)}",
+        "Connection: close"
+    ]
+    return "\r\n".join(headers).encode() + b"\r\n\r\n" + body
+
+def send_buffers(conn, buffers):
+    # Scatter-gather send: all buffers go out through sendmsg without being
+    # concatenated first. sendmsg may send only part, so continue from there.
+    if not hasattr(conn, "sendmsg"):  # not on Windows
+        for b in buffers:
+            conn.sendall(b)
+        return
+    views = [memoryview(b) for b in buffers]
+    while views:
+        sent = conn.sendmsg(views)
+        while views and sent >= len(views[0]):
+            sent -= len(views[0])
+            views.pop(0)
+        if views:
+            views[0] = views[0][sent:]
 
 def check_rate_limit(ip):
+    # Token bucket: holds up to RATE_LIMIT tokens, refills RATE_LIMIT per second,
+    # every request spends one. O(1) per check instead of walking old timestamps.
     now = time.monotonic()
-    with rate_lock:
-        q = rate_limits[ip]
-        while q and now - q[0] > 1:
-            q.popleft() # Remove requests older than 1 second
-        if len(q) >= RATE_LIMIT:
+    with rate_locks[hash(ip) & (RATE_SHARDS - 1)]:
+        tokens, last = buckets.get(ip, (RATE_LIMIT, now))
+        tokens = min(RATE_LIMIT, tokens + (now - last) * RATE_LIMIT)
+        if tokens < 1:
+            buckets[ip] = (tokens, now)
             return False
-        q.append(now)
+        buckets[ip] = (tokens - 1, now)
         return True
 
+def sweep_rate_limits():
+    # A completely refilled bucket behaves exactly like a missing one,
+    # so removing it is lossless and stops the dict from growing with every new IP
+    now = time.monotonic()
+    for ip in list(buckets):
+        with rate_locks[hash(ip) & (RATE_SHARDS - 1)]:
+            entry = buckets.get(ip)
+            if entry is None:
+                continue
+            tokens, last = entry
+            if tokens + (now - last) * RATE_LIMIT >= RATE_LIMIT:
+                del buckets[ip]
+
+def sweep_rate_limits_forever():
+    while True:
+        time.sleep(RATE_SWEEP_INTERVAL)
+        sweep_rate_limits()
+
 def handle_request(conn, addr, base_dir):
     ip = addr[0]
+    headers_sent = False
     try:
-        request = conn.recv(1024).decode("utf-8")
-        if not request:
-            return
+        # Headers can arrive in several TCP segments, read until the blank line
+        buf = bytearray()
+        while b"\r\n\r\n" not in buf:
+            chunk = conn.recv(8192)
+            if not chunk:
+                return
+            buf.extend(chunk)
+            if len(buf) > MAX_HEADER_SIZE:
+                response = "HTTP/1.1 413 Payload Too Large\r\n\r\nRequest headers too large"
+                conn.sendall(response.encode())
+                return
+        request = buf.decode("utf-8")
 
         if not check_rate_limit(ip):
             response = "HTTP/1.1 429 Too Many Requests\r\n\r\nRate limit exceeded"
@@ -85,12 +207,23 @@ def handle_request(conn, addr, base_dir):
         filepath = urllib.parse.unquote(path.lstrip("/"))
         full_path = os.path.join(base_dir, filepath)
 
-        if not os.path.exists(full_path):
+        # base_dir is already resolved by run_server, anything outside it ("..", symlinks) is refused.
+        # One stat answers "exists?", "directory?" and "how big?".
+        # ValueError: a %00 in the URL puts a null byte in the path, no such file
+        try:
+            real_path = os.path.realpath(full_path)
+            if real_path != base_dir and not real_path.startswith(base_dir + os.sep):
+                response = "HTTP/1.1 403 Forbidden\r\n\r\nForbidden"
+                conn.sendall(response.encode())
+                return
+            st = os.stat(full_path)
+        except (FileNotFoundError, NotADirectoryError, ValueError):
             response = "HTTP/1.1 404 Not Found\r\n\r\nFile not found"
             conn.sendall(response.encode())
             return
 
-        time.sleep(WORK_DELAY) #here we simulate some work being done
+        if WORK_DELAY > 0:
+            time.sleep(WORK_DELAY) #here we simulate some work being done
 
 
 
@@ -99,37 +232,46 @@ def handle_request(conn, addr, base_dir):
         # old_value = request_counts[full_path]
         # time.sleep(0.001)
         # request_counts[full_path] = old_value + 1 
-        with counts_lock:
-            request_counts[full_path] += 1
+        increment_count(full_path)
 
 
 
-        if os.path.isdir(full_path):
-            body = generate_directory_listing(full_path, path)
+        if stat.S_ISDIR(st.st_mode):
+            body = generate_directory_listing(full_path, path, st.st_mtime_ns)
             headers = [
                 "HTTP/1.1 200 OK",
                 "Content-Type: text/html; charset=UTF-8",
                 f"Content-Length: {len(body)}",
                 "Connection: close"
             ]
-            conn.sendall("\r\n".join(headers).encode() + b"\r\n\r\n" + body)
+            header_blob = ("\r\n".join(headers) + "\r\n\r\n").encode("ascii")
+            send_buffers(conn, [header_blob, body])
         else:
-            mime_type, _ = mimetypes.guess_type(full_path)
-            if mime_type is None:
-                mime_type = "application/octet-stream"
+            if st.st_size <= SMALL_FILE_LIMIT:
+                conn.sendall(load_small_file(full_path, st.st_mtime_ns))
+                return
 
+            # Open before sending the headers and take the length from the open file:
+            # during WORK_DELAY the file may have been removed or changed since the stat
             with open(full_path, "rb") as f:
-                body = f.read()
+                filesize = os.fstat(f.fileno()).st_size
+                headers = [
+                    "HTTP/1.1 200 OK",
+                    f"Content-Type: {guess_mime_type(full_path)}",
+                    f"Content-Length: {filesize}",
+                    "Connection: close"
+                ]
+                header_blob = ("\r\n".join(headers) + "\r\n\r\n").encode("ascii")
+                headers_sent = True
+                conn.sendall(header_blob)
 
-            headers = [
-                "HTTP/1.1 200 OK",
-                f"Content-Type: {mime_type}",
-                f"Content-Length: {len(body)}",
-                "Connection: close"
-            ]
-            conn.sendall("\r\n".join(headers).encode() + b"\r\n\r\n" + body)
+                # sendfile copies straight from the page cache to the socket,
+                # falls back to read/send itself where os.sendfile is missing (Windows)
+                conn.sendfile(f, 0, filesize)
 
     except Exception as e:
+        if headers_sent:
+            return    # A 200 is already out, a 500 after it would corrupt the response; just close
         error_msg = f"HTTP/1.1 500 Internal Server Error\r\n\r\nError: {str(e)}"
         conn.sendall(error_msg.encode())
     finally:
@@ -138,26 +280,44 @@ def handle_request(conn, addr, base_dir):
 
 def run_server(port, base_dir):
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        if hasattr(socket, "SO_REUSEPORT"):  # not on Windows
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)  # lets several server processes share the port
         s.bind(("0.0.0.0", port))
         s.listen()
         print(f"Serving {base_dir} on port {port}...")
         print(f"Open in browser: http://http://localhost/:{port}/")
 
+        base_dir = os.path.realpath(base_dir)  # resolved once, handle_request compares against it
+
+        sweeper = threading.Thread(target=sweep_rate_limits_forever)
+        sweeper.daemon = True #will not wait
+        sweeper.start()
+
+        # Reuse a fixed set of threads instead of creating one per connection
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS)
         try:
             while True: 
                 conn, addr = s.accept()   #addr - (addr ip, addr port); conn - socket object
-                print(f"Connection from {addr}")
-                thread = threading.Thread(target=handle_request, args=(conn, addr, base_dir))
-                thread.daemon = True #will not wait
-                thread.start()
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                conn.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER_SIZE)
+                logger.info("Connection from %s", addr)
+                future = executor.submit(handle_request, conn, addr, base_dir)
+                # A connection still queued at shutdown never reaches handle_request, close it here
+                future.add_done_callback(lambda f, conn=conn: f.cancelled() and conn.close())
         except KeyboardInterrupt:
             print("\nServer stopped by user")
+            # Drops the queued connections; the ones already being served are
+            # finished, since the interpreter joins pool threads on exit
+            executor.shutdown(wait=False, cancel_futures=True)
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Usage: python server.py <directory>")
         sys.exit(1)
 
+    # LOG_LEVEL=WARNING hides the per-connection lines, e.g. for load tests
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"), format="%(message)s")
+
     port = 8080
     base_dir = sys.argv[1]
     run_server(port, base_dir)
@@ -1,9 +1,14 @@
 import requests
+from requests.adapters import HTTPAdapter
 import time
 
 LEADER = "http://localhost:5000"
 FOLLOWERS = ["http://localhost:5001", "http://localhost:5002", "http://localhost:5003", "http://localhost:5004", "http://localhost:5005"]
 
+# Pooled keep-alive connections, sized for the 10 threads in test_concurrent_writes
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=32, pool_maxsize=20, max_retries=0))
+
 def wait_for_services(timeout=30):
     print("Here I check if all services are ready to avoid connection refused")
     start = time.time()
@@ -11,9 +16,9 @@ def wait_for_services(timeout=30):
     
     while time.time() - start < timeout and not all_ready:
         try:
-            requests.get(f"{LEADER}/admin/get_quorum", timeout=2)
+            SESSION.get(f"{LEADER}/admin/get_quorum", timeout=2)
             for f in FOLLOWERS:
-                requests.get(f"{f}/admin/store", timeout=2)
+                SESSION.get(f"{f}/admin/store", timeout=2)
             all_ready = True
             print("All services ready!")
         except:
@@ -29,7 +34,7 @@ def test_basic_write_and_read():
     value = "test-value-1"
     
     print(f"Writing key={key}, value={value} to leader...")
-    r = requests.post(f"{LEADER}/put/{key}", json={"value": value}, timeout=5)
+    r = SESSION.post(f"{LEADER}/put/{key}", json={"value": value}, timeout=5)
     print(f"Leader response: {r.status_code} - {r.json()}")
     
     assert r.status_code == 200, f"Expected 200, got {r.status_code}"
@@ -39,7 +44,7 @@ def test_basic_write_and_read():
     time.sleep(1)
     
     # Check leader
-    r = requests.get(f"{LEADER}/get/{key}", timeout=3)
+    r = SESSION.get(f"{LEADER}/get/{key}", timeout=3)
     assert r.status_code == 200
     assert r.json()["value"] == value
     print(f"Leader has correct value")
@@ -47,7 +52,7 @@ def test_basic_write_and_read():
     # Check all followers
     for i, follower in enumerate(FOLLOWERS, 1):
         try:
-            r = requests.get(f"{follower}/get/{key}", timeout=3)
+            r = SESSION.get(f"{follower}/get/{key}", timeout=3)
             if r.status_code == 200:
                 assert r.json()["value"] == value
                 print(f"Follower {i} has correct value")
@@ -59,7 +64,7 @@ def test_basic_write_and_read():
 def test_quorum_behavior():
     print("\n=== Test 2: Quorum Behavior ===")
     
-    r = requests.post(f"{LEADER}/admin/set_quorum", json={"quorum": 3}, timeout=5)
+    r = SESSION.post(f"{LEADER}/admin/set_quorum", json={"quorum": 3}, timeout=5)
     assert r.status_code == 200
     print("Set write quorum to 3")
     
@@ -67,7 +72,7 @@ def test_quorum_behavior():
     for i in range(5):
         key = f"quorum-test-{i}"
         value = f"value-{i}"
-        r = requests.post(f"{LEADER}/put/{key}", json={"value": value}, timeout=5)
+        r = SESSION.post(f"{LEADER}/put/{key}", json={"value": value}, timeout=5)
         if r.status_code == 200:
             replicas = r.json().get("replicas_confirmed", 0)
             print(f"Write {i+1}: confirmed on {replicas} replicas (quorum=3)")
@@ -83,7 +88,7 @@ def test_concurrent_writes():
     def write_key(i):
         key = f"concurrent-{i}"
         value = f"value-{i}"
-        r = requests.post(f"{LEADER}/put/{key}", json={"value": value}, timeout=10)
+        r = SESSION.post(f"{LEADER}/put/{key}", json={"value": value}, timeout=10)
         return r.status_code == 200
     
     with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
@@ -97,7 +102,7 @@ def test_concurrent_writes():
 def test_missing_key():
     print("\n=== Test 4: Missing Key Behavior ===")
     
-    r = requests.get(f"{LEADER}/get/nonexistent-key", timeout=3)
+    r = SESSION.get(f"{LEADER}/get/nonexistent-key", timeout=3)
     assert r.status_code == 404
     assert r.json()["found"] == False
     print("Correctly returns 404 for missing key")
@@ -1,4 +1,5 @@
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import random
 import statistics
@@ -13,13 +14,18 @@ TOTAL_WRITES = 10000
 CONCURRENCY = 20   # nr of concurrent threads
 KEY_SPACE = 100
 
+# One pooled session for all threads, so keep-alive connections get reused
+# and the test measures the server, not TCP setup
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=32, pool_maxsize=CONCURRENCY * 2, max_retries=0))
+
 def wait_for_services(timeout=30):
     print("Here I check if all services are ready to avoid connection refused")
     start = time.time()
     
     while time.time() - start < timeout:
         try:
-            requests.get(f"{LEADER}/admin/get_quorum", timeout=2)
+            SESSION.get(f"{LEADER}/admin/get_quorum", timeout=2)
             print("All services ready!")
             return
         except:
@@ -28,7 +34,7 @@ def wait_for_services(timeout=30):
     raise Exception("Services did not start in time")
 
 def set_quorum(q):
-    r = requests.post(f"{LEADER}/admin/set_quorum", json={"quorum": q}, timeout=5)
+    r = SESSION.post(f"{LEADER}/admin/set_quorum", json={"quorum": q}, timeout=5)
     if r.status_code == 200:
         print(f"Set write quorum to {q}")
     else:
@@ -38,7 +44,7 @@ def set_quorum(q):
 def single_write(key, value):
     t0 = time.time()
     try:
-        r = requests.post(f"{LEADER}/put/{key}", json={"value": value}, timeout=10)
+        r = SESSION.post(f"{LEADER}/put/{key}", json={"value": value}, timeout=10)
         t1 = time.time()
         return (r.status_code, r.text, (t1 - t0))
     except Exception as e:
@@ -166,7 +172,7 @@ def consistency_check():
     
     try:
         # Fetch leader store
-        r = requests.get(f"{LEADER}/admin/store", timeout=10)
+        r = SESSION.get(f"{LEADER}/admin/store", timeout=10)
         leader_store = r.json().get("store", {})
         leader_keys = set(leader_store.keys())
         print(f"Leader has {len(leader_keys)} keys")
@@ -175,7 +181,7 @@ def consistency_check():
         all_consistent = True
         for i, follower in enumerate(FOLLOWERS, 1):
             try:
-                r = requests.get(f"{follower}/admin/store", timeout=10)
+                r = SESSION.get(f"{follower}/admin/store", timeout=10)
                 follower_store = r.json().get("store", {})
                 follower_keys = set(follower_store.keys())
                 
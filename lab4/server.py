@@ -1,7 +1,9 @@
 import os
 import asyncio
 import random
-from aiohttp import web, ClientSession, ClientTimeout
+import uvloop
+import orjson
+from aiohttp import web, ClientSession, ClientTimeout, TCPConnector
 
 # In-memory key-value store with version numbers
 store = {}  # key -> (value, version)
@@ -17,6 +19,8 @@ PORT = int(os.environ.get("PORT", "5000"))
 FOLLOWERS = os.environ.get("FOLLOWERS", "")
 FOLLOWERS = [f.strip() for f in FOLLOWERS.split(",") if f.strip()]
 
+# Random network lag before each replication request, off unless SIMULATE_NETWORK_DELAY=1
+SIMULATE_NETWORK_DELAY = os.environ.get("SIMULATE_NETWORK_DELAY", "0") == "1"
 MIN_DELAY_MS = float(os.environ.get("MIN_DELAY", "0.1"))
 MAX_DELAY_MS = float(os.environ.get("MAX_DELAY", "1.0"))
 
@@ -25,17 +29,40 @@ WRITE_QUORUM = int(os.environ.get("WRITE_QUORUM", "1"))
 # Replication timeout per follower (seconds)
 REPL_TIMEOUT = float(os.environ.get("REPL_TIMEOUT", "2.0"))
 
+# Replication batching: up to BATCH_MAX writes per request, collected for at most BATCH_WINDOW ms
+BATCH_MAX = int(os.environ.get("BATCH_MAX", "64"))
+BATCH_WINDOW_MS = float(os.environ.get("BATCH_WINDOW", "2.0"))
+# Batch requests open at once per follower, and writes allowed to wait for one
+REPL_INFLIGHT = int(os.environ.get("REPL_INFLIGHT", "8"))
+REPL_QUEUE_MAX = int(os.environ.get("REPL_QUEUE_MAX", "1024"))
+
+# One HTTP client for the whole process, keeps connections to followers alive
+session = None
+# follower -> queue of (entry, future) waiting to be sent, and the tasks sending them
+replication_queues = {}
+replication_tasks = set()
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+def json_response(obj, status=200):
+    # Same as web.json_response, but encoded with orjson
+    return web.Response(body=orjson.dumps(obj), content_type="application/json", status=status)
+
 async def get_next_version():
     global version_counter
     async with version_lock:
         version_counter += 1
         return version_counter
 
+def apply_write(key, value, version):
+    # Caller must hold store_lock
+    current = store.get(key, (None, 0))
+    if version >= current[1]:
+        store[key] = (value, version)
+
 async def write_local(key, value, version):
     async with store_lock:
-        current = store.get(key, (None, 0))
-        if version >= current[1]:
-            store[key] = (value, version)
+        apply_write(key, value, version)
 
 async def read_local(key):
     async with store_lock:
@@ -46,53 +73,114 @@ async def get_key(request):
     key = request.match_info['key']
     val = await read_local(key)
     if val is None:
-        return web.json_response({"found": False}, status=404)
-    return web.json_response({"found": True, "value": val}, status=200)
+        return json_response({"found": False}, status=404)
+    return json_response({"found": True, "value": val}, status=200)
 
 async def replicate(request):
     try:
-        body = await request.json()
+        body = orjson.loads(await request.read())
     except:
-        return web.json_response({"error": "bad request"}, status=400)
+        return json_response({"error": "bad request"}, status=400)
     
     if "key" not in body or "value" not in body or "version" not in body:
-        return web.json_response({"error": "bad request"}, status=400)
+        return json_response({"error": "bad request"}, status=400)
     
     key = body["key"]
     value = body["value"]
     version = body["version"]
     await write_local(key, value, version)
-    return web.json_response({"status": "ok"}, status=200)
+    return json_response({"status": "ok"}, status=200)
 
-async def replicate_to_follower(session, follower_addr, key, value, version):
+async def replicate_batch(request):
     try:
-        delay_ms = random.uniform(MIN_DELAY_MS, MAX_DELAY_MS)
-        await asyncio.sleep(delay_ms / 1000.0)
+        body = orjson.loads(await request.read())
+        entries = body["entries"]
+    except:
+        return json_response({"error": "bad request"}, status=400)
+    
+    if not isinstance(entries, list) or not all(
+            isinstance(e, dict) and "key" in e and "value" in e and "version" in e for e in entries):
+        return json_response({"error": "bad request"}, status=400)
+    
+    # Whole batch under one lock acquisition
+    async with store_lock:
+        for e in entries:
+            apply_write(e["key"], e["value"], e["version"])
+    return json_response({"status": "ok"}, status=200)
+
+async def send_batch(follower_addr, entries):
+    try:
+        if SIMULATE_NETWORK_DELAY:
+            delay_ms = random.uniform(MIN_DELAY_MS, MAX_DELAY_MS)
+            await asyncio.sleep(delay_ms / 1000.0)
         
-        payload = {"key": key, "value": value, "version": version}
-        url = f"http://{follower_addr}/replicate"
+        payload = {"entries": entries}
+        url = f"http://{follower_addr}/replicate_batch"
         
         timeout = ClientTimeout(total=REPL_TIMEOUT)
-        async with session.post(url, json=payload, timeout=timeout) as resp:
+        async with session.post(url, data=orjson.dumps(payload), headers=JSON_HEADERS, timeout=timeout) as resp:
             if resp.status == 200:
                 return True
     except Exception:
         pass
     return False
 
+async def send_and_resolve(follower_addr, batch, slots):
+    try:
+        success = await send_batch(follower_addr, [entry for entry, _ in batch])
+        for _, fut in batch:
+            if not fut.done():
+                fut.set_result(success)
+    finally:
+        slots.release()
+
+async def replication_worker(follower_addr, queue):
+    # Sends queued writes to one follower, many per request and up to REPL_INFLIGHT
+    # requests at once, so one slow request doesn't hold up the rest. Batches may
+    # arrive out of order, the follower keeps the higher version anyway
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(REPL_INFLIGHT)
+    while True:
+        await slots.acquire()
+        batch = [await queue.get()]
+        deadline = loop.time() + BATCH_WINDOW_MS / 1000.0
+        while len(batch) < BATCH_MAX:
+            if not queue.empty():
+                batch.append(queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        
+        task = asyncio.create_task(send_and_resolve(follower_addr, batch, slots))
+        replication_tasks.add(task)
+        task.add_done_callback(replication_tasks.discard)
+
+async def replicate_to_follower(follower_addr, key, value, version):
+    fut = asyncio.get_running_loop().create_future()
+    try:
+        replication_queues[follower_addr].put_nowait(({"key": key, "value": value, "version": version}, fut))
+    except asyncio.QueueFull:
+        return False    # Follower is too far behind, it doesn't count towards the quorum
+    return await fut
+
 async def put_key(request):
     if ROLE != "leader":
-        return web.json_response({"error": "not leader"}, status=403)
+        return json_response({"error": "not leader"}, status=403)
     
     key = request.match_info['key']
     
     try:
-        body = await request.json()
+        body = orjson.loads(await request.read())
     except:
-        return web.json_response({"error": "bad request"}, status=400)
+        return json_response({"error": "bad request"}, status=400)
     
     if "value" not in body:
-        return web.json_response({"error": "bad request"}, status=400)
+        return json_response({"error": "bad request"}, status=400)
     
     value = body["value"]
     version = await get_next_version()
@@ -103,67 +191,98 @@ async def put_key(request):
     
     if len(FOLLOWERS) == 0:
         if required <= 0:
-            return web.json_response({"status": "ok", "replicas_confirmed": 0}, status=200)
+            return json_response({"status": "ok", "replicas_confirmed": 0}, status=200)
         else:
-            return web.json_response({"status": "error", "reason": "no followers"}, status=500)
+            return json_response({"status": "error", "reason": "no followers"}, status=500)
     
-    timeout = ClientTimeout(total=REPL_TIMEOUT)
-    async with ClientSession(timeout=timeout) as session:
-        tasks = [replicate_to_follower(session, f, key, value, version) for f in FOLLOWERS]
-        
-        confirmations = 0
-        for coro in asyncio.as_completed(tasks):
-            try:
-                success = await coro
-                if success:
+    pending = {asyncio.create_task(replicate_to_follower(f, key, value, version)) for f in FOLLOWERS}
+    
+    confirmations = 0
+    # A write waits at most REPL_TIMEOUT for its quorum, however long the follower queues are
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + REPL_TIMEOUT
+    try:
+        while pending and confirmations < required:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.result():
                     confirmations += 1
-                    if confirmations >= required:
-                        return web.json_response({
-                            "status": "ok",
-                            "replicas_confirmed": confirmations
-                        }, status=200)
-            except Exception:
-                pass
-        
-        if confirmations >= required:
-            return web.json_response({
-                "status": "ok",
-                "replicas_confirmed": confirmations
-            }, status=200)
-        else:
-            return web.json_response({
-                "status": "error",
-                "replicas_confirmed": confirmations,
-                "reason": "quorum not reached"
-            }, status=500)
+    finally:
+        # Quorum reached, stop waiting on the slower followers. Their writes are
+        # already queued, the replication worker still sends them
+        for t in pending:
+            t.cancel()
+    
+    if confirmations >= required:
+        return json_response({
+            "status": "ok",
+            "replicas_confirmed": confirmations
+        }, status=200)
+    else:
+        return json_response({
+            "status": "error",
+            "replicas_confirmed": confirmations,
+            "reason": "quorum not reached"
+        }, status=500)
 
 async def admin_set_quorum(request):
     global WRITE_QUORUM
     if ROLE != "leader":
-        return web.json_response({"error": "not leader"}, status=403)
+        return json_response({"error": "not leader"}, status=403)
     
     try:
-        body = await request.json()
+        body = orjson.loads(await request.read())
     except:
-        return web.json_response({"error": "bad request"}, status=400)
+        return json_response({"error": "bad request"}, status=400)
     
     if "quorum" not in body:
-        return web.json_response({"error": "bad request"}, status=400)
+        return json_response({"error": "bad request"}, status=400)
     
     WRITE_QUORUM = int(body["quorum"])
-    return web.json_response({"status": "ok", "write_quorum": WRITE_QUORUM}, status=200)
+    return json_response({"status": "ok", "write_quorum": WRITE_QUORUM}, status=200)
 
 async def admin_get_quorum(request):
-    return web.json_response({"write_quorum": WRITE_QUORUM}, status=200)
+    return json_response({"write_quorum": WRITE_QUORUM}, status=200)
 
 async def admin_store_dump(request):
     async with store_lock:
-        return web.json_response({"store": {k: v[0] for k, v in store.items()}}, status=200)
+        return json_response({"store": {k: v[0] for k, v in store.items()}}, status=200)
+
+async def start_session(app):
+    global session
+    session = ClientSession(connector=TCPConnector(limit=0, limit_per_host=64, keepalive_timeout=30))
+
+async def close_session(app):
+    await session.close()
+
+async def start_replication(app):
+    for f in FOLLOWERS:
+        queue = asyncio.Queue(maxsize=REPL_QUEUE_MAX)
+        replication_queues[f] = queue
+        task = asyncio.create_task(replication_worker(f, queue))
+        replication_tasks.add(task)
+        task.add_done_callback(replication_tasks.discard)
+
+async def stop_replication(app):
+    # Runs on shutdown, before run_app waits for the remaining tasks: a worker
+    # left running would keep starting new batch requests from its backlog
+    tasks = list(replication_tasks)
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
 
 def create_app():
     app = web.Application()
+    app.on_startup.append(start_session)
+    app.on_startup.append(start_replication)
+    app.on_shutdown.append(stop_replication)
+    app.on_cleanup.append(close_session)
     app.router.add_get('/get/{key}', get_key)
     app.router.add_post('/replicate', replicate)
+    app.router.add_post('/replicate_batch', replicate_batch)
     app.router.add_post('/put/{key}', put_key)
     app.router.add_post('/admin/set_quorum', admin_set_quorum)
     app.router.add_get('/admin/get_quorum', admin_get_quorum)
@@ -173,4 +292,5 @@ def create_app():
 if __name__ == "__main__":
     app = create_app()
     print(f"Starting {ROLE} on port {PORT}")
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())  # faster drop-in event loop
     web.run_app(app, host="0.0.0.0", port=PORT)
\ No newline at end of file